@@ -7,27 +7,140 @@ Note: This module is not included in the prefect pipeline or tested as this woul
 require including libpostal in CI which would add a 2-3GB overhead...
 """
 
+from functools import partial
+from importlib.metadata import version
+from multiprocessing import get_context
+from os import cpu_count
 from pathlib import Path
+from threading import Lock
+from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 
+import numpy as np
 import pandas as pd
 
 from icontract import require
+from pandas.api.types import CategoricalDtype
+from pandas.api.types import is_categorical_dtype
+from pandas.api.types import union_categoricals
 from postal.expand import expand_address
 from postal.parser import parse_address
 from prefect import Flow
 from prefect import task
-from string_grouper import group_similar_strings
+from prefect.engine.executors import LocalDaskExecutor
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from string_grouper import StringGrouper
 
 from drem.filepaths import PROCESSED_DIR
 from drem.filepaths import RAW_DIR
+from drem.utilities.postal_cache import map_with_cache
+
+
+CHUNKSIZE = 512
+ROW_GROUP_SIZE = 512 * 1024
+POSTAL_CACHE_DIR = PROCESSED_DIR / "postal_cache"
+# Bump if the libpostal wrappers below change so that stale results aren't reused
+POSTAL_CACHE_VERSION = 1
+
+_process_pool_lock = Lock()
+
+# Forking a multi-threaded process (such as one running a threaded executor) can
+# deadlock so pool workers are forked from a single-threaded forkserver instead.
+# libpostal loads its ~2GB of models on import so these are preloaded into the
+# forkserver once, and every worker then shares them copy-on-write rather than
+# re-importing libpostal when unpickling the functions it is passed
+_process_context = get_context("forkserver")
+_process_context.set_forkserver_preload(["postal.expand", "postal.parser"])
+
+# See https://github.com/openvenues/libpostal#parser-labels
+POSTAL_LABELS = (
+    "house",
+    "category",
+    "near",
+    "house_number",
+    "road",
+    "unit",
+    "level",
+    "staircase",
+    "entrance",
+    "po_box",
+    "postcode",
+    "suburb",
+    "city_district",
+    "city",
+    "island",
+    "state_district",
+    "state",
+    "country_region",
+    "country",
+    "world_region",
+)
+
+
+def _expand_address_to_first_expansion(address: str) -> str:
+
+    return expand_address(address)[0]
+
+
+def _parse_address(address: str) -> List[Tuple[str, str]]:
+
+    return parse_address(address)
+
+
+def _map_unique_in_parallel(func: Callable[[Any], Any], column: pd.Series) -> pd.Series:
+    """Apply func to each unique value of column across all cores.
+
+    libpostal calls are pure and per-string so unique values not already cached on
+    disk are dispatched to a process pool and the results broadcast back onto the
+    column.
+
+    Args:
+        func (Callable[[Any], Any]): Picklable (module-level) function of one value
+        column (pd.Series): Column to be mapped
+
+    Returns:
+        pd.Series: Result of func for each row of column
+    """
+    unique_values = column.drop_duplicates().tolist()
+    results = _apply_in_parallel_with_cache(func, unique_values)
+
+    return column.map(dict(zip(unique_values, results)))
+
+
+def _apply_in_parallel(func: Callable[[Any], Any], values: List[Any]) -> List[Any]:
+
+    # Each pool already uses every core so concurrent flow branches take turns
+    with _process_pool_lock:
+        with _process_context.Pool(cpu_count()) as pool:
+            return pool.map(func, values, chunksize=CHUNKSIZE)
+
+
+def _apply_in_parallel_with_cache(
+    func: Callable[[str], Any], values: List[str],
+) -> List[Any]:
+
+    cache_filename = (
+        f"{func.__name__}-v{POSTAL_CACHE_VERSION}-postal-{version('postal')}"
+    )
+
+    return map_with_cache(
+        values,
+        compute=partial(_apply_in_parallel, func),
+        cache_filepath=POSTAL_CACHE_DIR / cache_filename,
+    )
 
 
 @task
-def _read_parquet_file(filepath: Path) -> pd.DataFrame:
+def _read_parquet_file(
+    filepath: Path, columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
 
-    return pd.read_parquet(filepath)
+    return pd.read_parquet(filepath, engine="pyarrow", columns=columns)
 
 
 @task
@@ -36,7 +149,10 @@ def _aggregate_columns(
     df: pd.DataFrame, column_names: List[str], to_column: str,
 ) -> pd.DataFrame:
 
-    df[to_column] = df[column_names].agg(", ".join, axis="columns")
+    first_column, *other_columns = column_names
+    df[to_column] = df[first_column].str.cat(
+        others=[df[column] for column in other_columns], sep=", ",
+    )
 
     return df
 
@@ -47,8 +163,8 @@ def _standardise_addresses(
     addresses: pd.DataFrame, on_column: str, to_column: str,
 ) -> pd.DataFrame:
 
-    addresses[to_column] = addresses[on_column].apply(
-        lambda cell: expand_address(cell)[0],
+    addresses[to_column] = _map_unique_in_parallel(
+        _expand_address_to_first_expansion, addresses[on_column],
     )
 
     return addresses
@@ -87,9 +203,9 @@ def _sum_energies_for_multiple_entry_addresses(
         result (str): New column to store results of summation
 
     Returns:
-        pd.DataFrame: [description]
+        pd.DataFrame: MPRN or GPRN data with the summed energies in result column
     """
-    df[result] = df.groupby(on).sum(target).reset_index(drop=True)
+    df[result] = df.groupby(on, sort=False, observed=True)[target].transform("sum")
 
     return df
 
@@ -100,7 +216,8 @@ def _dedupe_column(df: pd.DataFrame, target: str, result: str) -> pd.DataFrame:
     """Deduplicate similar strings in column.
 
     Will group and rename similar strings such as 'leinster house' and 'lenister house'
-    under a single spelling.
+    under a single spelling. Strings are linked wherever `string_grouper` finds them
+    similar and each connected group is renamed to its first occurring member.
 
     Args:
         df (pd.DataFrame): DataFrame containing column to be deduped
@@ -110,7 +227,35 @@ def _dedupe_column(df: pd.DataFrame, target: str, result: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame containing deduped column
     """
-    df[result] = group_similar_strings(df[target], min_similarity=0.95)
+    unique_strings = pd.Series(df[target].drop_duplicates().to_numpy())
+    string_positions = pd.Index(unique_strings)
+
+    matches = StringGrouper(unique_strings, min_similarity=0.95).fit().get_matches()
+    similarity_graph = coo_matrix(
+        (
+            np.ones(len(matches)),
+            (
+                string_positions.get_indexer(matches["left_side"]),
+                string_positions.get_indexer(matches["right_side"]),
+            ),
+        ),
+        shape=(len(unique_strings), len(unique_strings)),
+    )
+    _, group_labels = connected_components(similarity_graph, directed=False)
+    grouped_strings = unique_strings.groupby(group_labels).transform("first")
+
+    df[result] = df[target].map(
+        pd.Series(grouped_strings.to_numpy(), index=unique_strings),
+    )
+
+    return df
+
+
+@task
+@require(lambda df, column_names: set(column_names).issubset(set(df.columns)))
+def _to_categorical(df: pd.DataFrame, column_names: List[str]) -> pd.DataFrame:
+
+    df[column_names] = df[column_names].astype("category")
 
     return df
 
@@ -129,69 +274,87 @@ def _merge_mprn_and_gprn_on_common_addresses(
     mprn: pd.DataFrame, gprn: pd.DataFrame, on: List[str], **kwargs,
 ) -> pd.DataFrame:
 
+    for column in on:
+        if is_categorical_dtype(mprn[column]) and is_categorical_dtype(gprn[column]):
+            shared_categories = CategoricalDtype(
+                union_categoricals([mprn[column], gprn[column]]).categories,
+            )
+            mprn[column] = mprn[column].astype(shared_categories)
+            gprn[column] = gprn[column].astype(shared_categories)
+
     return mprn.merge(gprn, on=on, **kwargs)
 
 
 @task
 @require(lambda df, target: target in df.columns)
-def _parse_standardised_address(
-    df: pd.DataFrame, target: str, result: str,
-) -> pd.DataFrame:
+def _explode_parsed_address(df: pd.DataFrame, target: str) -> pd.DataFrame:
+    """Parse addresses into their components and add each component as a column.
 
-    df[result] = df.copy()[target].apply(lambda cell: parse_address(cell))
+    Each unique address is parsed once by `libpostal` into (component, label) pairs
+    such as ('dublin', 'city'), and each label found in any address is broadcast back
+    onto df as a column.
 
-    return df
-
-
-@task
-@require(lambda df, target: target in df.columns)
-def _convert_parsed_address_to_dict(
-    df: pd.DataFrame, target: str, result: str,
-) -> pd.DataFrame:
+    Args:
+        df (pd.DataFrame): DataFrame containing standardised addresses
+        target (str): Name of standardised address column
 
-    df[result] = df.copy()[target].apply(
-        lambda cell: {pair[1]: pair[0] for pair in cell},
+    Returns:
+        pd.DataFrame: DataFrame with a column for each parsed address label
+    """
+    address_codes, unique_addresses = pd.factorize(df[target])
+    parsed_addresses = _apply_in_parallel_with_cache(
+        _parse_address, list(unique_addresses),
     )
 
-    return df
-
-
-@task
-def _reset_index(df: pd.DataFrame) -> pd.DataFrame:
-
-    return df.reset_index()
-
-
-@task
-@require(lambda df, target: target in df.columns)
-@require(
-    lambda df: (len(df) - 1) == df.index[-1],
-    "Index must reflect actual length for pd.concat to succeed.",
-)
-def _expand_parsed_address_dict(df: pd.DataFrame, target: str) -> pd.DataFrame:
-
-    parsed_address = pd.json_normalize(df[target])
-
-    return pd.concat([df, parsed_address], axis="columns")
+    # keep any labels libpostal returns that aren't documented as extra columns
+    found_labels = {
+        found_label
+        for parsed_address in parsed_addresses
+        for _, found_label in parsed_address
+    }
+    labels = [*POSTAL_LABELS, *sorted(found_labels.difference(POSTAL_LABELS))]
+    label_rows = {row_label: row for row, row_label in enumerate(labels)}
+
+    # factorize codes missing addresses as -1, so an extra trailing column of None
+    # ensures these rows get no components rather than those of the last address
+    components = np.full((len(labels), len(parsed_addresses) + 1), None, dtype=object)
+    for address_index, parsed_address in enumerate(parsed_addresses):
+        for component, component_label in parsed_address:
+            components[label_rows[component_label], address_index] = component
+
+    for column_label, label_components in zip(labels, components):
+        if any(component is not None for component in label_components):
+            df[column_label] = label_components[address_codes]
 
-
-@task
-@require(lambda df, column_names: set(column_names).issubset(set(df.columns)))
-def _drop_columns(df: pd.DataFrame, column_names: List[str]) -> pd.DataFrame:
-
-    return df.drop(columns=column_names)
+    return df
 
 
 @task
 def _save_to_parquet_file(df: pd.DataFrame, filepath: Path) -> None:
 
-    df.to_parquet(filepath)
+    df.to_parquet(
+        filepath,
+        engine="pyarrow",
+        compression="zstd",
+        compression_level=3,
+        row_group_size=ROW_GROUP_SIZE,
+        use_dictionary=True,
+    )
 
 
 with Flow("Merge MPRN and GPRN") as flow:
 
+    # Only GPRN is projected as all MPRN columns are carried through to m_and_r
     mprn_raw = _read_parquet_file(RAW_DIR / "mprn.parquet")
-    gprn_raw = _read_parquet_file(RAW_DIR / "gprn.parquet")
+    gprn_raw = _read_parquet_file(
+        RAW_DIR / "gprn.parquet",
+        columns=[
+            "PB Name",
+            "Location",
+            "Attributable Total Final Consumption (kWh)",
+            "Year",
+        ],
+    )
     vo_raw = _read_parquet_file(PROCESSED_DIR / "vo_dublin.parquet")
 
     mprn_aggregated = _aggregate_columns(
@@ -207,8 +370,11 @@ with Flow("Merge MPRN and GPRN") as flow:
     mprn_address_deduped = _dedupe_column(
         mprn_with_addresses, target="standardised_address", result="deduped_address",
     )
+    mprn_categorised = _to_categorical(
+        mprn_address_deduped, column_names=["standardised_address"],
+    )
     mprn_summated = _sum_energies_for_multiple_entry_addresses(
-        mprn_address_deduped,
+        mprn_categorised,
         on=["standardised_address", "Year"],
         target="electricity_demand_kwh_year",
         result="summated_electricity_demand_kwh_year",
@@ -228,8 +394,11 @@ with Flow("Merge MPRN and GPRN") as flow:
     gprn_address_deduped = _dedupe_column(
         gprn_with_addresses, target="standardised_address", result="deduped_address",
     )
+    gprn_categorised = _to_categorical(
+        gprn_address_deduped, column_names=["standardised_address"],
+    )
     gprn_summated = _sum_energies_for_multiple_entry_addresses(
-        gprn_address_deduped,
+        gprn_categorised,
         on=["standardised_address", "Year"],
         target="gas_demand_kwh_year",
         result="summated_gas_demand_kwh_year",
@@ -252,38 +421,23 @@ with Flow("Merge MPRN and GPRN") as flow:
         how="left",
         indicator=True,
     )
-    m_and_r_with_parsed_address = _parse_standardised_address(
-        m_and_r_raw, target="standardised_address", result="parsed_address",
-    )
-    m_and_r_with_parsed_address_dict = _convert_parsed_address_to_dict(
-        m_and_r_with_parsed_address,
-        target="parsed_address",
-        result="parsed_address_dict",
-    )
-    m_and_r_with_parsed_address_expanded = _expand_parsed_address_dict(
-        m_and_r_with_parsed_address_dict, target="parsed_address_dict",
+    m_and_r_with_parsed_address = _explode_parsed_address(
+        m_and_r_raw, target="standardised_address",
     )
 
     vo_with_standardised_address = _standardise_addresses(
         vo_raw, on_column="Address", to_column="standardised_address",
     )
-    vo_with_parsed_address = _parse_standardised_address(
-        vo_with_standardised_address,
-        target="standardised_address",
-        result="parsed_address",
-    )
-    vo_with_parsed_address_dict = _convert_parsed_address_to_dict(
-        vo_with_parsed_address, target="parsed_address", result="parsed_address_dict",
-    )
-    vo_with_index_reset = _reset_index(vo_with_parsed_address_dict)
-    vo_with_parsed_address_expanded = _expand_parsed_address_dict(
-        vo_with_index_reset, target="parsed_address_dict",
+    vo_with_parsed_address = _explode_parsed_address(
+        vo_with_standardised_address, target="standardised_address",
     )
 
-    m_and_r_compatible_with_parquet = _drop_columns(
-        m_and_r_with_parsed_address_expanded,
-        column_names=["parsed_address", "parsed_address_dict"],
-    )
     _save_to_parquet_file(
-        m_and_r_compatible_with_parquet, PROCESSED_DIR / "m_and_r.parquet",
+        m_and_r_with_parsed_address, PROCESSED_DIR / "m_and_r.parquet",
     )
+
+
+if __name__ == "__main__":
+
+    # mprn, gprn and vo branches are independent so run them concurrently
+    flow.run(executor=LocalDaskExecutor(scheduler="threads", num_workers=cpu_count()))
@@ -1,7 +1,12 @@
+import re
+
 from pathlib import Path
 from typing import Any
+from typing import Callable
 from typing import Iterable
 from typing import List
+from typing import Match
+from typing import Pattern
 from typing import Union
 
 import pandas as pd
@@ -28,7 +33,7 @@ def get_columns(df: pd.DataFrame, column_names: Iterable[str]) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A new DataFrame containing only the specified columns
     """
-    return df.copy().loc[:, column_names]
+    return df.loc[:, column_names]
 
 
 @task
@@ -49,7 +54,7 @@ def get_sum_of_columns(
     Returns:
         pd.DataFrame: [description]
     """
-    df[result] = df[target].copy().sum(axis=1)
+    df[result] = df[target].sum(axis=1)
 
     return df
 
@@ -69,7 +74,7 @@ def get_rows_where_column_contains_substring(
         pd.DataFrame: A copy of df containing only rows where column contains substring
     """
     rows = df[target].str.contains(substring)
-    return df.copy()[rows].reset_index(drop=True)
+    return df[rows].reset_index(drop=True)
 
 
 class GetRowsWhereColumnContainsSubstring(Task):
@@ -90,7 +95,6 @@ class GetRowsWhereColumnContainsSubstring(Task):
         Returns:
             pd.DataFrame: A copy of df containing only rows where column contains substring
         """
-        df = df.copy()
         rows = df[target].str.contains(substring)
         return df[rows].reset_index(drop=True)
 
@@ -165,6 +169,34 @@ def read_html(filepath: Path, **kwargs: Any) -> List[pd.DataFrame]:
     return pd.read_html(str(filepath), **kwargs)
 
 
+def _replace_substring(
+    column: pd.Series,
+    pat: Union[str, Pattern],
+    repl: Union[str, Callable[[Match], str]],
+    **kwargs: Any,
+) -> pd.Series:
+
+    if kwargs.get("regex") is False or not isinstance(pat, str):
+        return column.str.replace(pat, repl, **kwargs)
+
+    kwargs.pop("regex", None)
+    flags = kwargs.pop("flags", 0)
+    case = kwargs.pop("case", None)
+
+    is_literal = (
+        flags == 0 and case is None and not callable(repl) and re.escape(pat) == pat
+    )
+    if is_literal:
+        return column.str.replace(pat, repl, regex=False, **kwargs)
+
+    # pandas won't accept case alongside a compiled pattern so fold it into flags
+    if case is False:
+        flags |= re.IGNORECASE
+    compiled_pat = re.compile(pat, flags=flags)
+
+    return column.str.replace(compiled_pat, repl, regex=True, **kwargs)
+
+
 @task
 def replace_substring_in_column(
     df: pd.DataFrame, target: str, result: str, **kwargs: Any,
@@ -184,7 +216,7 @@ def replace_substring_in_column(
     """
     df = df.copy()
 
-    df[result] = df[target].astype(str).str.replace(**kwargs)
+    df[result] = _replace_substring(df[target].astype(str), **kwargs)
 
     return df
 
@@ -214,7 +246,7 @@ class ReplaceSubstringInColumn(Task):
         """
         df = df.copy()
 
-        df[result] = df[target].astype(str).str.replace(**kwargs)
+        df[result] = _replace_substring(df[target].astype(str), **kwargs)
 
         return df
 
@@ -405,8 +437,6 @@ def groupby_sum(df: pd.DataFrame, by: Iterable[str], target: str) -> pd.DataFram
     Returns:
         pd.DataFrame: DataFrame
     """
-    df = df.copy()
-
     return df.groupby(by=by, as_index=False)[target].sum()
 
 
@@ -430,6 +460,4 @@ class GroupbySum(Task):
         Returns:
             pd.DataFrame: DataFrame
         """
-        df = df.copy()
-
         return df.groupby(by=by, as_index=False)[target].sum()
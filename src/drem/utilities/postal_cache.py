@@ -0,0 +1,49 @@
+# shelve pickles values, which is safe here as the cache is only ever written with
+# results computed by drem itself on the local filesystem
+import shelve  # noqa: S403
+
+from pathlib import Path
+from threading import Lock
+from typing import Any
+from typing import Callable
+from typing import List
+
+
+# shelve doesn't support concurrent access so threads must take turns
+_cache_lock = Lock()
+
+
+def map_with_cache(
+    values: List[str],
+    compute: Callable[[List[str]], List[Any]],
+    cache_filepath: Path,
+) -> List[Any]:
+    """Map values to results, only computing results missing from an on-disk cache.
+
+    `libpostal` standardisation and parsing are pure functions of the address string
+    so results can be reused across pipeline runs.
+
+    Args:
+        values (List[str]): Strings to be mapped
+        compute (Callable[[List[str]], List[Any]]): Maps a list of strings to a list
+            of (picklable) results in the same order
+        cache_filepath (Path): Path to shelve cache file (created if it doesn't exist)
+
+    Returns:
+        List[Any]: Result for each value
+    """
+    Path(cache_filepath).parent.mkdir(parents=True, exist_ok=True)
+
+    with _cache_lock:
+        with shelve.open(str(cache_filepath)) as cache:  # noqa: S301
+            uncached_values = [value for value in set(values) if value not in cache]
+
+    # compute outside of the lock so concurrent flow branches aren't serialised
+    computed_results = compute(uncached_values) if uncached_values else []
+
+    with _cache_lock:
+        with shelve.open(str(cache_filepath)) as cache:  # noqa: S301
+            for value, result in zip(uncached_values, computed_results):
+                cache[value] = result
+
+            return [cache[value] for value in values]
@@ -76,3 +76,100 @@ def test_replace_substring_in_column_replaces_co_dublin_in_postcodes() -> None:
         flags=re.VERBOSE,
     )
     assert_frame_equal(output, expected_output)
+
+
+def test_replace_substring_in_column_replaces_literal_substring() -> None:
+    """Replace literal (non-regex) substring 'County' with 'Co'."""
+    postcodes = pd.DataFrame({"raw_postcodes": ["Dublin 1", "County Dublin"]})
+    expected_output = pd.DataFrame(
+        {
+            "raw_postcodes": ["Dublin 1", "County Dublin"],
+            "clean_postcodes": ["Dublin 1", "Co Dublin"],
+        },
+    )
+
+    output = pdt.replace_substring_in_column.run(
+        postcodes,
+        target="raw_postcodes",
+        result="clean_postcodes",
+        pat="County",
+        repl="Co",
+    )
+    assert_frame_equal(output, expected_output)
+
+
+def test_replace_substring_in_column_ignores_case_of_literal_substring() -> None:
+    """Replace literal substring regardless of case if case=False."""
+    postcodes = pd.DataFrame({"raw_postcodes": ["CORK", "Cork"]})
+    expected_output = pd.DataFrame(
+        {"raw_postcodes": ["CORK", "Cork"], "clean_postcodes": ["Co", "Co"]},
+    )
+
+    output = pdt.replace_substring_in_column.run(
+        postcodes,
+        target="raw_postcodes",
+        result="clean_postcodes",
+        pat="cork",
+        repl="Co",
+        case=False,
+    )
+    assert_frame_equal(output, expected_output)
+
+
+def test_replace_substring_in_column_ignores_case_of_regex() -> None:
+    """Replace regex matches regardless of case if case=False."""
+    postcodes = pd.DataFrame({"raw_postcodes": ["DUBLIN 01", "dublin 02"]})
+    expected_output = pd.DataFrame(
+        {
+            "raw_postcodes": ["DUBLIN 01", "dublin 02"],
+            "clean_postcodes": ["Dublin 1", "Dublin 2"],
+        },
+    )
+
+    output = pdt.replace_substring_in_column.run(
+        postcodes,
+        target="raw_postcodes",
+        result="clean_postcodes",
+        pat=r"dublin 0(\d)",
+        repl=r"Dublin \1",
+        case=False,
+    )
+    assert_frame_equal(output, expected_output)
+
+
+def test_replace_substring_in_column_accepts_compiled_pattern() -> None:
+    """Replace matches of an already compiled pattern."""
+    postcodes = pd.DataFrame({"raw_postcodes": ["Dublin 01"]})
+    expected_output = pd.DataFrame(
+        {"raw_postcodes": ["Dublin 01"], "clean_postcodes": ["Dublin 1"]},
+    )
+
+    output = pdt.replace_substring_in_column.run(
+        postcodes,
+        target="raw_postcodes",
+        result="clean_postcodes",
+        pat=re.compile(r"0(?=\d)"),
+        repl="",
+    )
+    assert_frame_equal(output, expected_output)
+
+
+def _lowercase_match(match: re.Match) -> str:
+    return match.group(0).lower()
+
+
+def test_replace_substring_in_column_accepts_callable_repl() -> None:
+    """Replace literal substring with the output of a callable repl."""
+    postcodes = pd.DataFrame({"raw_postcodes": ["County Dublin"]})
+    expected_output = pd.DataFrame(
+        {"raw_postcodes": ["County Dublin"], "clean_postcodes": ["county Dublin"]},
+    )
+
+    output = pdt.replace_substring_in_column.run(
+        postcodes,
+        target="raw_postcodes",
+        result="clean_postcodes",
+        pat="County",
+        repl=_lowercase_match,
+    )
+    assert_frame_equal(output, expected_output)
@@ -0,0 +1,28 @@
+from functools import partial
+from pathlib import Path
+from typing import List
+
+from drem.utilities.postal_cache import map_with_cache
+
+
+def _upper_and_record(values: List[str], computed: List[str]) -> List[str]:
+    computed.extend(values)
+    return [value.upper() for value in values]
+
+
+def test_map_with_cache_only_computes_uncached_values(tmp_path: Path) -> None:
+    """Compute each value once across calls and return results in input order.
+
+    Args:
+        tmp_path (Path): a pytest plugin to create temporary directories
+    """
+    computed: List[str] = []
+    upper = partial(_upper_and_record, computed=computed)
+    cache_filepath = tmp_path / "postal_cache" / "upper"
+
+    first_output = map_with_cache(["a", "b", "a"], upper, cache_filepath)
+    second_output = map_with_cache(["b", "c"], upper, cache_filepath)
+
+    assert first_output == ["A", "B", "A"]
+    assert second_output == ["B", "C"]
+    assert sorted(computed) == ["a", "b", "c"]